@@ -15,57 +15,88 @@ file.
 
 from . import code_set
 from . import control_characters
-import codecs
 import re
+from functools import partial
+from types import MethodType
 from .arib_exceptions import FileOpenError
 
+# .ass override tags for the ARIB foreground color control characters.
+# .ass colors are given as {\c&H<bb><gg><rr>&}
+COLOR_CODES = {
+    control_characters.BKF: "{\\c&H000000&}",
+    control_characters.RDF: "{\\c&H0000ff&}",
+    control_characters.GRF: "{\\c&H00ff00&}",
+    control_characters.YLF: "{\\c&H00ffff&}",
+    control_characters.BLF: "{\\c&Hff0000&}",
+    control_characters.MGF: "{\\c&Hff00ff&}",
+    control_characters.CNF: "{\\c&Hffff00&}",
+    control_characters.WHF: "{\\c&Hffffff&}",
+}
+
+STYLE_MEDIUM = "{\\rmedium}"
+STYLE_NORMAL = "{\\rnormal}"
+STYLE_SMALL = "{\\rsmall}"
+
+# %-style templates, which skip the str.format() parsing on every call.
+# {\r<style>}<color>{\pos(<x>,<y>)}
+POSITION_FORMAT = "{\\r%s}%s{\\pos(%s,%s)}"
+# as above, but anchoring the text by its lower left corner
+LL_POSITION_FORMAT = POSITION_FORMAT + "{\\an1}"
+DIALOGUE_FORMAT = "Dialogue: 0,%s,%s,normal,,0000,0000,0000,,%s\\N\n"
+
 
 class Pos(object):
     """Screen position in pixels"""
 
-    def __init__(self, x, y):
-        self._x = x
-        self._y = y
-
-    @property
-    def x(self):
-        return self._x
+    __slots__ = ("x", "y")
 
-    @property
-    def y(self):
-        return self._y
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
 
 
 class Dialog(object):
     """text and dialog"""
 
-    def __init__(self, s, x=None, y=None):
-        self._s = s
-        self._x = x
-        self._y = y
+    __slots__ = ("_parts", "_len", "_header")
+
+    def __init__(self, s, header=None):
+        """
+        :param s: initial dialog text
+        :param header: optional (template, args) for the position tags that begin
+          the dialog. These are only formatted when the dialog is written out, and
+          don't count towards its length, so a dialog holding nothing but a
+          position is empty and never written.
+        """
+        # text is accumulated as a list of fragments and only joined
+        # when the dialog is written out.
+        self._parts = [s]
+        self._len = len(s)
+        self._header = header
 
     def __iadd__(self, other):
-        self._s += other
+        self._parts.append(other)
+        self._len += len(other)
         return self
 
     def __len__(self):
-        return len(self._s)
+        return self._len
+
+    def text(self):
+        if self._header is None:
+            return "".join(self._parts)
+        template, args = self._header
+        return template % args + "".join(self._parts)
 
 
 class Size(object):
     """Screen width, height of an area in pixels"""
 
-    def __init__(self, w, h):
-        self._w = w
-        self._h = h
+    __slots__ = ("width", "height")
 
-    @property
-    def width(self):
-        return self._w
-
-    @property
-    def height(self):
-        return self._h
+    def __init__(self, w, h):
+        self.width = w
+        self.height = h
 
 
 class TextSize(object):
@@ -84,6 +115,21 @@ class ClosedCaptionArea(object):
         self._char_spacing = 4
         self._line_spacing = 24
 
+        # the geometry above is fixed, so work out the character cell size for
+        # each text size once. See RowCol2ScreenPos for how size affects these.
+        w = self._CharacterDim.width + self._char_spacing
+        h = self._CharacterDim.height + self._line_spacing
+        self._cell_width = {
+            TextSize.SMALL: w / float(2),
+            TextSize.MEDIUM: w / float(2),
+            TextSize.NORMAL: w,
+        }
+        self._cell_height = {
+            TextSize.SMALL: h / float(2),
+            TextSize.MEDIUM: h,
+            TextSize.NORMAL: h,
+        }
+
     @property
     def UL(self):
         return self._UL
@@ -104,23 +150,27 @@ class ClosedCaptionArea(object):
         # the LL. So we adjust for this by adding one row before adjusting for text size.
         r = row + 1
         c = col
-        w = self._CharacterDim.width + self._char_spacing
-        h = self._CharacterDim.height + self._line_spacing
-        if size == TextSize.SMALL:
-            h = h / float(2)
-
-        if size == TextSize.SMALL or size == TextSize.MEDIUM:
-            w = w / float(2)
-
-        return Pos(self.UL.x + c * w, self.UL.y + r * h)
+        w = self._cell_width[size]
+        h = self._cell_height[size]
+        return Pos(self._UL.x + c * w, self._UL.y + r * h)
 
 
 class ASSFile(object):
     """Wrapper for a single open utf-8 encoded .ass subtitle file"""
 
+    # dialog lines are small and numerous, so buffer them and let the
+    # file object hit the disk in large chunks.
+    WRITE_BUFFER_SIZE = 1 << 20
+
     def __init__(self, filepath, width=960, height=540):
         try:
-            self._f = codecs.open(filepath, "w", encoding="utf8")
+            self._f = open(
+                filepath,
+                "w",
+                encoding="utf8",
+                newline="",
+                buffering=ASSFile.WRITE_BUFFER_SIZE,
+            )
             self.write_header(width, height, filepath)
             self.write_styles()
             self.write_event_header()
@@ -182,60 +232,50 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
 
 def asstime(seconds):
     """format floating point seconds elapsed time to 0:02:14.53"""
-    hrs = int(seconds / 3600)
-    seconds -= 3600 * hrs
-    mins = int(seconds / 60)
-    seconds -= 60 * mins
-    return "{h:d}:{m:02d}:{s:02.2f}".format(h=hrs, m=mins, s=seconds)
+    hrs, seconds = divmod(seconds, 3600)
+    mins, seconds = divmod(seconds, 60)
+    return "%d:%02d:%02.2f" % (hrs, mins, seconds)
 
 
 def kanji(formatter, k, timestamp):
-    formatter.open_file()
     formatter._current_lines[-1] += str(k)
     # print unicode(k)
 
 
 def alphanumeric(formatter, a, timestamp):
-    formatter.open_file()
     formatter._current_lines[-1] += str(a)
     # print unicode(a)
 
 
 def hiragana(formatter, h, timestamp):
-    formatter.open_file()
     formatter._current_lines[-1] += str(h)
     # print unicode(h)
 
 
 def katakana(formatter, k, timestamp):
-    formatter.open_file()
     formatter._current_lines[-1] += str(k)
     # print unicode(k)
 
 
 def medium(formatter, k, timestamp):
-    formatter.open_file()
-    formatter._current_lines[-1] += "{\\rmedium}" + formatter._current_color
+    formatter._current_lines[-1] += STYLE_MEDIUM + formatter._current_color
     formatter._current_style = "medium"
     formatter._current_textsize = TextSize.MEDIUM
 
 
 def normal(formatter, k, timestamp):
-    formatter.open_file()
-    formatter._current_lines[-1] += "{\\rnormal}" + formatter._current_color
+    formatter._current_lines[-1] += STYLE_NORMAL + formatter._current_color
     formatter._current_style = "normal"
     formatter._current_textsize = TextSize.NORMAL
 
 
 def small(formatter, k, timestamp):
-    formatter.open_file()
-    formatter._current_lines[-1] += "{\\rsmall}" + formatter._current_color
+    formatter._current_lines[-1] += STYLE_SMALL + formatter._current_color
     formatter._current_style = "small"
     formatter._current_textsize = TextSize.SMALL
 
 
 def space(formatter, k, timestamp):
-    formatter.open_file()
     formatter._current_lines[-1] += " "
 
 
@@ -243,60 +283,9 @@ def drcs(formatter, c, timestamp):
     formatter._current_lines[-1] += "�"
 
 
-def black(formatter, k, timestamp):
-    formatter.open_file()
-    # {\c&H000000&} \c&H<bb><gg><rr>& {\c&Hffffff&}
-    formatter._current_lines[-1] += "{\c&H000000&}"
-    formatter._current_color = "{\c&H000000&}"
-
-
-def red(formatter, k, timestamp):
-    # {\c&H0000ff&}
-    formatter.open_file()
-    formatter._current_lines[-1] += "{\c&H0000ff&}"
-    formatter._current_color = "{\c&H0000ff&}"
-
-
-def green(formatter, k, timestamp):
-    # {\c&H00ff00&}
-    formatter.open_file()
-    formatter._current_lines[-1] += "{\c&H00ff00&}"
-    formatter._current_color = "{\c&H00ff00&}"
-
-
-def yellow(formatter, k, timestamp):
-    # {\c&H00ffff&}
-    formatter.open_file()
-    formatter._current_lines[-1] += "{\c&H00ffff&}"
-    formatter._current_color = "{\c&H00ffff&}"
-
-
-def blue(formatter, k, timestamp):
-    # {\c&Hff0000&}
-    formatter.open_file()
-    formatter._current_lines[-1] += "{\c&Hff0000&}"
-    formatter._current_color = "{\c&Hff0000&}"
-
-
-def magenta(formatter, k, timestamp):
-    # {\c&Hff00ff&}
-    formatter.open_file()
-    formatter._current_lines[-1] += "{\c&Hff00ff&}"
-    formatter._current_color = "{\c&Hff00ff&}"
-
-
-def cyan(formatter, k, timestamp):
-    # {\c&Hffff00&}
-    formatter.open_file()
-    formatter._current_lines[-1] += "{\c&Hffff00&}"
-    formatter._current_color = "{\c&Hffff00&}"
-
-
-def white(formatter, k, timestamp):
-    # {\c&Hffffff&}
-    formatter.open_file()
-    formatter._current_lines[-1] += "{\c&Hffffff&}"
-    formatter._current_color = "{\c&Hffffff&}"
+def set_color(formatter, k, timestamp, code):
+    formatter._current_lines[-1] += code
+    formatter._current_color = code
 
 
 def position_set(formatter, p, timestamp):
@@ -304,13 +293,14 @@ def position_set(formatter, p, timestamp):
     So we have to calculate pixel coordinates (and then sale them)
     """
     pos = formatter._CCArea.RowCol2ScreenPos(p.row, p.col, formatter._current_textsize)
-    line = "{{\\r{style}}}{color}{{\pos({x},{y})}}".format(
-        color=formatter._current_color, style=formatter._current_style, x=pos.x, y=pos.y
+    header = (
+        POSITION_FORMAT,
+        (formatter._current_style, formatter._current_color, pos.x, pos.y),
     )
-    formatter._current_lines.append(Dialog(line))
+    formatter._current_lines.append(Dialog("", header))
 
 
-a_regex = r'<CS:"(?P<x>\d{1,4});(?P<y>\d{1,4}) a">'
+a_regex = re.compile(r'<CS:"(?P<x>\d{1,4});(?P<y>\d{1,4}) a">')
 
 
 def control_character(formatter, csi, timestamp):
@@ -320,26 +310,24 @@ def control_character(formatter, csi, timestamp):
     <CS:"7 S"><CS:"170;30 _"><CS:"620;480 V"><CS:"36;36 W"><CS:"4 X"><CS:"24 Y"><Small Text><CS:"170;389 a">
     """
     cmd = str(csi)
-    a_match = re.search(a_regex, cmd)
+    # cheap test before running the regex: only positioning sequences end in ' a'
+    if not cmd.endswith(' a">'):
+        return
+    a_match = a_regex.search(cmd)
     if a_match:
         # APS Control Sequences (absolute positioning of text as <CS: 170;389 a> above
         # indicate the LOWER LEFT HAND CORNER of text position.
         x = a_match.group("x")
         y = a_match.group("y")
-        formatter._current_lines.append(
-            Dialog(
-                "{{\\r{style}}}{color}{{\\pos({x},{y})}}{{\\an1}}".format(
-                    color=formatter._current_color,
-                    style=formatter._current_style,
-                    x=x,
-                    y=y,
-                )
-            )
+        header = (
+            LL_POSITION_FORMAT,
+            (formatter._current_style, formatter._current_color, x, y),
         )
+        formatter._current_lines.append(Dialog("", header))
         return
 
 
-pos_regex = r"({\\pos\(\d{1,4},\d{1,4}\)})"
+pos_regex = re.compile(r"({\\pos\(\d{1,4},\d{1,4}\)})")
 
 
 def clear_screen(formatter, cs, timestamp):
@@ -352,22 +340,18 @@ def clear_screen(formatter, cs, timestamp):
     if (
         len(formatter._current_lines[0]) or len(formatter._current_lines)
     ) and start_time != end_time:
-        for l in reversed(formatter._current_lines):
-            if not len(l):
-                continue
-
-            line = "Dialogue: 0,{start_time},{end_time},normal,,0000,0000,0000,,{line}\\N\n".format(
-                start_time=start_time, end_time=end_time, line=l._s
-            )
-            # TODO: add option to dump to stdout
-            # print line.encode('utf-8')
-            if formatter._ass_file:
-                formatter._ass_file.write(line)
-            formatter._current_lines = [Dialog("")]
+        # TODO: add option to dump to stdout
+        # lines are discarded if the file isn't open yet (no nonempty captions)
+        if formatter._ass_file:
+            write = formatter._ass_file.write
+            for l in reversed(formatter._current_lines):
+                if l._len:
+                    write(DIALOGUE_FORMAT % (start_time, end_time, l.text()))
+        formatter._current_lines = [Dialog("")]
 
     formatter._elapsed_time_s = timestamp
     formatter._current_textsize = TextSize.NORMAL
-    formatter._current_color = "{\c&Hffffff&}"
+    formatter._current_color = COLOR_CODES[control_characters.WHF]
 
 
 class ASSFormatter(object):
@@ -391,14 +375,8 @@ class ASSFormatter(object):
         control_characters.CS: clear_screen,
         control_characters.CSI: control_character,  # {\pos(<X>,<Y>)}
         # control_characters.COL,
-        control_characters.BKF: black,  # {\c&H000000&} \c&H<bb><gg><rr>&
-        control_characters.RDF: red,  # {\c&H0000ff&}
-        control_characters.GRF: green,  # {\c&H00ff00&}
-        control_characters.YLF: yellow,  # {\c&H00ffff&}
-        control_characters.BLF: blue,  # {\c&Hff0000&}
-        control_characters.MGF: magenta,  # {\c&Hff00ff&}
-        control_characters.CNF: cyan,  # {\c&Hffff00&}
-        control_characters.WHF: white,  # {\c&Hffffff&}
+        # foreground colors: {\c&H<bb><gg><rr>&}
+        **{cc: partial(set_color, code=code) for cc, code in COLOR_CODES.items()},
         # largely unhandled DRCS just replaces them with unicode unknown character square
         code_set.DRCS0: drcs,
         code_set.DRCS1: drcs,
@@ -418,6 +396,22 @@ class ASSFormatter(object):
         code_set.DRCS15: drcs,
     }
 
+    # objects that mark the caption data as nonempty. format() opens the .ass
+    # file the first time it is handed one of these.
+    OPENING_CC_STATEMENTS = frozenset(
+        [
+            code_set.Kanji,
+            code_set.Alphanumeric,
+            code_set.Hiragana,
+            code_set.Katakana,
+            control_characters.MSZ,
+            control_characters.NSZ,
+            control_characters.SP,
+            control_characters.SSZ,
+        ]
+        + list(COLOR_CODES)
+    )
+
     def __init__(
         self,
         default_color="white",
@@ -441,20 +435,26 @@ class ASSFormatter(object):
         self._ass_file = None
         self._current_lines = [Dialog("")]
         self._current_style = "normal"
-        self._current_color = "{\c&Hffffff&}"
+        self._current_color = COLOR_CODES[control_characters.WHF]
         self._current_textsize = TextSize.NORMAL
         self._filename = video_filename
         self._width = width
         self._height = height
         self._height = height
         self._verbose = verbose
+        # handlers bound to this formatter, so format() makes one lookup per object
+        self._dispatch = {
+            t: MethodType(handler, self)
+            for t, handler in ASSFormatter.DISPLAYED_CC_STATEMENTS.items()
+        }
 
     def open_file(self):
-        if not self._ass_file:
-            if self._verbose:
-                print("Found nonempty ARIB closed caption data in file.")
-                print(("Writing .ass file: " + self._filename))
-            self._ass_file = ASSFile(self._filename)
+        if self._ass_file is not None:
+            return
+        if self._verbose:
+            print("Found nonempty ARIB closed caption data in file.")
+            print(("Writing .ass file: " + self._filename))
+        self._ass_file = ASSFile(self._filename)
 
     def file_written(self):
         return self._ass_file is not None
@@ -465,11 +465,18 @@ class ASSFormatter(object):
         # print('File elapsed time seconds: {s}'.format(s=timestamp))
         # line = u'{t}: {l}\n'.format(t=timestamp, l=u''.join([unicode(s) for s in captions if type(s) in ASSFormatter.DISPLAYED_CC_STATEMENTS]))
 
+        # check for the file once per call rather than in every handler
+        if self._ass_file is None:
+            opening = ASSFormatter.OPENING_CC_STATEMENTS
+            if any(type(c) in opening for c in captions):
+                self.open_file()
+
+        handler_for = self._dispatch.get
         for c in captions:
-            if type(c) in ASSFormatter.DISPLAYED_CC_STATEMENTS:
+            handler = handler_for(type(c))
+            if handler is not None:
                 # invoke the handler for this object type
-                ASSFormatter.DISPLAYED_CC_STATEMENTS[type(c)](self, c, timestamp)
-            else:
-                # TODO: Warning of unhandled characters
-                pass
-                # print str(type(c))
+                handler(c, timestamp)
+            # TODO: Warning of unhandled characters
+            # else:
+            #   print str(type(c))
@@ -12,6 +12,9 @@ an ARIB data group
 
 """
 
+import hashlib
+import io
+
 from . import read
 from .decoder import Decoder
 from . import code_set
@@ -56,11 +59,7 @@ class CaptionStatementData(object):
                 "Caption statement: data unit loop length: "
                 + str(self._data_unit_loop_length)
             )
-        bytes_read = 0
-        self._data_units = []
-        while bytes_read < self._data_unit_loop_length:
-            self._data_units.append(DataUnit(f))
-            bytes_read += self._data_units[-1].size()
+        self._data_units = DataUnit.parse_loop(f, self._data_unit_loop_length)
 
     def load_caption_statement_data(self, data):
         """Load class contents from caption statement data payload"""
@@ -68,10 +67,8 @@ class CaptionStatementData(object):
 
 
 def next_data_unit(caption_statement_data):
-    current = 0
-    while current < len(caption_statement_data._data_units):
-        yield caption_statement_data._data_units[current]
-        current += 1
+    """Iterate over the data units in caption statement data"""
+    return iter(caption_statement_data._data_units)
 
 
 class StatementBody(object):
@@ -111,16 +108,21 @@ class StatementBody(object):
                 )
             )
         statements = []
-        bytes_read = 0
+        # decode from an in memory copy of the statement body, which also
+        # bounds the decoder to exactly bytes_to_read bytes.
+        body = io.BytesIO(read.buffer(f, bytes_to_read))
         # TODO: Check to see if decoder state is carred between packet processing
         # currently recreating the decoder (and therefore resetting its state)
         # on every packet paylod processing. This may be incorrect
         decoder = Decoder()
-        line = ""
-        while bytes_read < bytes_to_read:
-            statement = decoder.decode(f)
+        while body.tell() < bytes_to_read:
+            try:
+                statement = decoder.decode(body)
+            except read.EOFError:
+                # the final character runs past the end of the statement body.
+                # Drop it rather than failing the whole data group.
+                break
             if statement:
-                bytes_read += len(statement)
                 statements.append(statement)
             # if isinstance(statement, code_set.Kanji) or isinstance(statement, code_set.Alphanumeric) \
             #  or isinstance(statement, code_set.Hiragana) or isinstance(statement, code_set.Katakana):
@@ -141,78 +143,75 @@ class DRCSFont(object):
     # a small hash table mapping to known (encountered) values.
     # There seems to be at least two new DRCS characters in every .ts file I
     # examine, so this is very limited.
+    # Keys are DRCSFont.pixel_hash() values of the raw pixel data.
     character_hashes = {
-        -3174437220813644284: "♬",
-        3626218632846089044: "[ｽﾋﾟｰｶｰ]",  # u"\U0001F50A", # unicode 'speaker with 3 sound U+1f50A
-        -7036522249175460012: "[ｽﾋﾟｰｶｰ]",  # u"\U0001F508", # unicode "SPEAKER U+1F508
-        7569189553178784666: "[ﾊﾟｿｺﾝ]",  # u"\U0001F4BB", #unicode personal computer U+1F4BB
-        -7054764751876937278: "[ﾃﾚﾋﾞ]",  # u"\U0001F4FA", # unicode TV U+1f4fa
-        7675785349947576464: "[携帯]",  # u"\U0001F4F1", # unicode cellphone U+1F4F1
-        -8588766517861681222: "｟",
-        -137322149189423910: "｠",
-        -8884896295922033014: "⟪",
-        -5876459750587952470: "⟫",
-        2149867084803144864: "[ﾃﾚﾋﾞ]",  # u"\U0001F4FA", # unicode TV U+1f4fa
-        -6623079553638809300: "[ﾏｲｸ]",
-        -3827305093498498888: "𝔹",  # custom Conan 'meitantei badge". yes. really.
-        -775118510460996568: "｟",
-        -4397084408988046416: "｠",
-        -6328951014288157962: "[ﾊﾟｿｺﾝ]",
-        1113567731799993878: "①",
-        6707059547002745896: "[ﾗｼﾞｵ]",
-        6692026985814559272: "[携帯]",
+        1132125627950662342: "♬",
+        1945283457424431052: "[ｽﾋﾟｰｶｰ]",  # u"\U0001F50A", # unicode 'speaker with 3 sound U+1f50A
+        -6471837925154432211: "[ｽﾋﾟｰｶｰ]",  # u"\U0001F508", # unicode "SPEAKER U+1F508
+        756840833114606081: "[ﾊﾟｿｺﾝ]",  # u"\U0001F4BB", #unicode personal computer U+1F4BB
+        8273995425476156857: "[ﾃﾚﾋﾞ]",  # u"\U0001F4FA", # unicode TV U+1f4fa
+        -5325913099462356538: "[携帯]",  # u"\U0001F4F1", # unicode cellphone U+1F4F1
+        6435547473326647582: "｟",
+        -8670949839977515739: "｠",
+        -3045199008806166456: "[ﾃﾚﾋﾞ]",  # u"\U0001F4FA", # unicode TV U+1f4fa
+        -8947492756810149204: "[ﾏｲｸ]",
+        -7233534937977595175: "𝔹",  # custom Conan 'meitantei badge". yes. really.
+        -320467192191258346: "｟",
+        6759979904021446808: "｠",
+        -7982239904666692135: "[ﾊﾟｿｺﾝ]",
+        -7316079400111087104: "①",
+        4396665729813648432: "[ﾗｼﾞｵ]",
+        -443575655598281819: "[携帯]",
+        -1099384046023835863: "⟪",
+        9105141994175621484: "⟫",
     }
 
+    @staticmethod
+    def pixel_hash(pixels):
+        """Stable 64 bit signed hash of raw DRCS pixel data"""
+        digest = hashlib.blake2b(pixels, digest_size=8).digest()
+        return int.from_bytes(digest, "big", signed=True)
+
     # first is  combiled font id + font number four bits each
     def __init__(self, f):
-        b = read.ucb(f)
-        self._font_id = (b & 0xF0) >> 8
+        # font id/mode, followed by depth, width and height for modes 0 and 1
+        header = read.buffer(f, 4)
+        b = header[0]
+        self._font_id = (b & 0xF0) >> 4
         self._mode = b & 0x0F
         if self._mode == 0 or self._mode == 0x1:
-            self._depth = read.ucb(f)
-            self._width = read.ucb(f)
-            self._height = read.ucb(f)
-            self._pixels = []
+            self._depth = header[1]
+            self._width = header[2]
+            self._height = header[3]
 
             # assuming 4 pixels per byte. How is this tied to depth above? (typical depth = 2)
-            for i in range(int((self._width * self._height) / 4)):
-                self._pixels.append(read.ucb(f))
-
-            tmp_str = str(self._pixels)
-            self._hash = hash(tmp_str)
+            self._pixels = read.buffer(f, (self._width * self._height) // 4)
+            self._hash = DRCSFont.pixel_hash(self._pixels)
 
             if DRCS_DEBUG:
                 print(("DRCS character font id: {id}".format(id=self._font_id)))
                 print(("DRCS character hash: {h}".format(h=self._hash)))
 
-            if self._hash in DRCSFont.character_hashes:
-                self._character = DRCSFont.character_hashes[self._hash]
-            else:
-                self._character = "�"
+            self._character = DRCSFont.character_hashes.get(self._hash, "�")
 
         else:
             raise ValueError("DRCSFont mode not supported.")
         if DRCS_DEBUG:
-            print(("DRCS character: font: {font}".format(font=self._font_id)))
-            px = ""
-            i = 0
-            for h in range(self._height / 2):
-                for w in range(self._width / 4):
-                    # px += str(self._pixels[i]) + " "
-                    p = self._pixels[h * self._width / 2 + w]
-                    if p == 0:
-                        px += " "
-                    elif p == 0xFF:
-                        px += "█"
-                    elif p == 0x0F:
-                        px += "▐"
-                    elif p == 0xF0:
-                        px += "▌"
-                    else:
-                        px += "╳"
-                    i = i + 1
-                px += "\n"
-            print(px)
+            self._debug_render()
+
+    # block characters used to sketch a byte (four 2 bit pixels) of glyph data
+    DEBUG_RENDER_BLOCKS = {0x00: " ", 0xFF: "█", 0x0F: "▐", 0xF0: "▌"}
+
+    def _debug_render(self):
+        """Dump a rough picture of the glyph to stdout"""
+        print(("DRCS character: font: {font}".format(font=self._font_id)))
+        blocks = DRCSFont.DEBUG_RENDER_BLOCKS
+        rows = []
+        for h in range(self._height // 2):
+            start = h * self._width // 2
+            row = self._pixels[start : start + self._width // 4]
+            rows.append("".join(blocks.get(p, "╳") for p in row))
+        print("\n".join(rows) + "\n")
 
 
 class DRCSCharacter(object):
@@ -222,8 +221,9 @@ class DRCSCharacter(object):
         """
         :param f: file descriptor we're reading from
         """
-        self._character_code = read.usb(f)
-        self._number_of_font = read.ucb(f)
+        header = read.buffer(f, 3)
+        self._character_code = (header[0] << 8) | header[1]
+        self._number_of_font = header[2]
         self._fonts = []
         for i in range(self._number_of_font):
             self._fonts.append(DRCSFont(f))
@@ -261,15 +261,17 @@ class DataUnit(object):
     """Data Unit structure as defined in ARIB B-24 Table 9-12 pg 157"""
 
     def __init__(self, f):
-        self._unit_separator = read.ucb(f)
+        # unit separator, data unit type and 24 bit data unit size
+        header = read.buffer(f, 5)
+        self._unit_separator = header[0]
         if self._unit_separator != 0x1F:
             if DEBUG:
                 print("Unit separator not found at start of data unit.")
             raise ValueError
-        self._data_unit_type = read.ucb(f)
+        self._data_unit_type = header[1]
         if DEBUG:
             print("data unit type: " + str(self._data_unit_type))
-        self._data_unit_size = read.ui3b(f)
+        self._data_unit_size = int.from_bytes(header[2:5], "big")
         if DEBUG:
             print("DataUnit size found to be: " + str(self._data_unit_size))
         # self._payload = f.read(self._data_unit_size)
@@ -282,6 +284,15 @@ class DataUnit(object):
         """return size of inflated data unit in bytes"""
         return self._data_unit_size + 5
 
+    @staticmethod
+    def parse_loop(f, loop_length):
+        """Read a data unit loop of loop_length bytes and return its data units"""
+        units = io.BytesIO(read.buffer(f, loop_length))
+        data_units = []
+        while units.tell() < loop_length:
+            data_units.append(DataUnit(units))
+        return data_units
+
     def load_unit(self, f):
         if self._data_unit_type == StatementBody.ID:
             return StatementBody(f, self)
@@ -349,39 +360,31 @@ class CaptionManagementData(object):
     NO_ROLLUP = 0b00
     ROLLUP = 0b01
 
+    # caption format strings per table 9-7 p175
+    DISPLAY_FORMATS = {
+        0x0: "Horizontal writing in standard density:",
+        0x1: "Vertical writing in standard density:",
+        0x2: "Horizontal writing in high density:",
+        0x3: "Vertical writing in high density:",
+        0x4: "Horizontal writing of Western language:",
+        0x6: "Horizontal writing in 1920x1080:",
+        0x7: "Vertical writing in 1920x1080:",
+        0x8: "Horizontal writing in 960x540:",
+        0x9: "Vertical writing in 960x540:",
+        0xA: "Horizontal writing in 1280x720:",
+        0xB: "Vertical writing in 1280x720:",
+        0xC: "Horizontal writing in 720x480:",
+        0xD: "Vertical writing in 720x480:",
+    }
+
     @staticmethod
     def display_format(format):
         """Caption managment format code to string
         After Arib b24 std table9-7 p175
         """
-        if format == 0x0:
-            return "Horizontal writing in standard density:"
-        if format == 0x1:
-            return "Vertical writing in standard density:"
-        if format == 0x2:
-            return "Horizontal writing in high density:"
-        if format == 0x3:
-            return "Vertical writing in high density:"
-        if format == 0x4:
-            return "Horizontal writing of Western language:"
-        if format == 0x6:
-            return "Horizontal writing in 1920x1080:"
-        if format == 0x7:
-            return "Vertical writing in 1920x1080:"
-        if format == 0x8:
-            return "Horizontal writing in 960x540:"
-        if format == 0x9:
-            return "Vertical writing in 960x540:"
-        if format == 0xA:
-            return "Horizontal writing in 1280x720:"
-        if format == 0xB:
-            return "Vertical writing in 1280x720:"
-        if format == 0xC:
-            return "Horizontal writing in 720x480:"
-        if format == 0xD:
-            return "Vertical writing in 720x480:"
-        else:
-            return "invalid caption managment format value."
+        return CaptionManagementData.DISPLAY_FORMATS.get(
+            format, "invalid caption managment format value."
+        )
 
     def num_languages(self):
         return len(self._languages)
@@ -410,8 +413,4 @@ class CaptionManagementData(object):
                 "Caption managmentdata : data unit loop length: "
                 + str(self._data_unit_loop_length)
             )
-        bytes_read = 0
-        self._data_units = []
-        while bytes_read < self._data_unit_loop_length:
-            self._data_units.append(DataUnit(f))
-            bytes_read += self._data_units[-1].size()
+        self._data_units = DataUnit.parse_loop(f, self._data_unit_loop_length)
@@ -49,7 +49,10 @@ class DataGroup(object):
         if DEBUG:
             print("__DATA_GROUP_START__")
 
-        self._stuffing_byte = read.ucb(f)
+        # fixed size data group header, parsed field by field below
+        header = read.buffer(f, 8)
+
+        self._stuffing_byte = header[0]
         if DEBUG:
             print(hex(self._stuffing_byte))
         if self._stuffing_byte != 0x80:
@@ -57,7 +60,7 @@ class DataGroup(object):
                 "Initial stuffing byte not equal to 0x80: " + hex(self._stuffing_byte)
             )
 
-        self._data_identifier = read.ucb(f)
+        self._data_identifier = header[1]
         if DEBUG:
             print(hex(self._data_identifier))
         if self._data_identifier != 0xFF:
@@ -66,7 +69,7 @@ class DataGroup(object):
                 + hex(self._data_identifier)
             )
 
-        self._private_stream_id = read.ucb(f)
+        self._private_stream_id = header[2]
         if DEBUG:
             print(hex(self._private_stream_id))
         if self._private_stream_id != 0xF0:
@@ -74,13 +77,13 @@ class DataGroup(object):
                 "Private stream id not equal to 0xf0: " + hex(self._private_stream_id)
             )
 
-        self._group_id = read.ucb(f)
+        self._group_id = header[3]
         if DEBUG:
             print("group id " + str((self._group_id >> 2) & (~0x20)))
-        self._group_link_number = read.ucb(f)
+        self._group_link_number = header[4]
         if DEBUG:
             print(str(self._group_link_number))
-        self._last_group_link_number = read.ucb(f)
+        self._last_group_link_number = header[5]
         if DEBUG:
             print(str(self._last_group_link_number))
         if self._group_link_number != self._last_group_link_number:
@@ -92,7 +95,7 @@ class DataGroup(object):
                     + str(self._last_group_link_number)
                 )
             )
-        self._data_group_size = read.usb(f)
+        self._data_group_size = (header[6] << 8) | header[7]
         if DEBUG:
             print("data group size found is " + str(self._data_group_size))
 
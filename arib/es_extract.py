@@ -27,7 +27,8 @@ from .closed_caption import set_DRCS_debug
 
 set_DRCS_debug(True)
 
-DISPLAYED_CC_STATEMENTS = [
+# set rather than list: formatter() tests every decoded statement against this
+DISPLAYED_CC_STATEMENTS = {
     code_set.Kanji,
     code_set.Alphanumeric,
     code_set.Hiragana,
@@ -66,7 +67,7 @@ DISPLAYED_CC_STATEMENTS = [
     control_characters.WHF,
     # control_characters.TIME,
     control_characters.HLC,
-]
+}
 
 
 def formatter(statements, timestamp):
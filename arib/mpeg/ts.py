@@ -9,7 +9,6 @@ DATE: Thursday, October 20th 2016
 """
 import os
 import sys
-import argparse
 import struct
 
 # memorymap file on 64 bit systems
@@ -77,6 +76,8 @@ class TS(object):
     """very minimalistic Transport stream handling"""
 
     PACKET_SIZE = 188
+    # packets checked for sync at a time when reading a memory mapped file
+    SYNC_CHECK_PACKETS = 4096
 
     # Sync byte
     SYNC_BYTE_INDEX = 0
@@ -106,6 +107,9 @@ class TS(object):
     ADAPTATION_FIELD_ONLY = 0b10
     ADAPTATION_FIELD_AND_PAYLOAD = 0b11
     ADAPTATION_FIELD_RESERVED = 0b00
+    # adaptation field control bit set for both ADAPTATION_FIELD_ONLY and
+    # ADAPTATION_FIELD_AND_PAYLOAD, i.e. whenever an adaptation field is present
+    ADAPTATION_FIELD_PRESENT_MASK = ADAPTATION_FIELD_ONLY << 4
 
     # Continuity counter
     CONTINUITY_COUNTER_INDEX = 3
@@ -127,34 +131,79 @@ class TS(object):
         with open(filename, "rb") as f:
 
             # memory map the file if necessary (prob requires 64 bit systems)
-            _file = f
             if memorymap:
                 _file = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                # packets are handed out as memoryview slices of the map, so
+                # nothing is copied out of the page cache per packet
+                view = memoryview(_file)
+                size = len(_file)
+                block_size = TS.PACKET_SIZE * TS.SYNC_CHECK_PACKETS
+                pos = 0
+                while pos < size:
+                    # in a clean stream every packet in the block starts with a
+                    # sync byte, so check them all with one strided slice and
+                    # hand out the packets up to the first bad one unexamined
+                    syncs = _file[pos : pos + block_size : TS.PACKET_SIZE]
+                    clean = len(syncs) - len(syncs.lstrip(b"\x47"))
+                    end = pos + clean * TS.PACKET_SIZE
+                    for start in range(pos, end, TS.PACKET_SIZE):
+                        yield view[start : start + TS.PACKET_SIZE]
+                    pos = end
+                    if clean == len(syncs):
+                        continue
+                    # first byte SHOULD be the sync byte
+                    # but if it isn't find one. None left means the rest of
+                    # the file is trailing junk, so the stream ends here.
+                    pos = TS.find_sync(_file, pos + 1)
+                    if pos < 0:
+                        return
+                    yield view[pos : pos + TS.PACKET_SIZE]
+                    pos += TS.PACKET_SIZE
+                return
 
+            _file = f
             while True:
                 packet = _file.read(TS.PACKET_SIZE)
                 if packet:
                     # first byte SHOULD be the sync byte
                     # but if it isn't find one.
                     if packet[0] != TS.SYNC_BYTE:
-                        start_byte = 0
-                        print(packet[0])
-                        for i in range(start_byte, TS.PACKET_SIZE):
-                            if packet[i] == TS.SYNC_BYTE:
-                                start_byte = i
-                                break
+                        start_byte = packet.find(TS.SYNC_BYTE, 1)
+                        # nothing but junk left at the end of the file
+                        if start_byte < 0 and len(packet) < TS.PACKET_SIZE:
+                            break
                         # didn't find a new start? FAIL
-                        if start_byte == 0:
+                        if start_byte < 0:
                             raise Exception(
                                 "failure to find sync byte in ts packet size."
                             )
-                            continue
                         remainder = _file.read(TS.PACKET_SIZE - start_byte)
                         packet = packet[start_byte:] + remainder
                     yield packet
                 else:
                     break
 
+    @staticmethod
+    def find_sync(buf, start):
+        """Find the first sync byte in buf at or after start that is followed
+        by sync bytes at the next two packet boundaries (as far as buf goes),
+        so a stray 0x47 in a payload isn't taken for a packet start.
+        Returns -1 if there is no such sync byte.
+        """
+        size = len(buf)
+        while True:
+            # find() is a memchr scan, far cheaper than walking bytes in Python
+            i = buf.find(b"\x47", start)
+            if i < 0:
+                return -1
+            j = i + TS.PACKET_SIZE
+            k = j + TS.PACKET_SIZE
+            if (j >= size or buf[j] == TS.SYNC_BYTE) and (
+                k >= size or buf[k] == TS.SYNC_BYTE
+            ):
+                return i
+            start = i + 1
+
     @staticmethod
     def check_packet_formedness(packet):
         """Check some features of this packet and see if it's well formed or not"""
@@ -221,16 +270,29 @@ class TS(object):
         """Get the Program Clock Reference for this packet if present.
         Can return 0 if data not present.
         """
-        if not TS.adaptation_field_present(packet):
+        # this runs for every packet in the file, so test the adaptation field
+        # control bits in place rather than going through the helpers above
+        afc = (
+            packet[TS.ADAPTATION_FIELD_CONTROL_INDEX] & TS.ADAPTATION_FIELD_CONTROL_MASK
+        )
+        if afc == TS.NO_ADAPTATION_FIELD << 4:
             return 0
         if not packet[TS.ADAPTATION_FIELD_DATA_INDEX] & TS.PCR_FLAG_MASK:
             return 0
-        b1 = struct.unpack(">L", packet[TS.PCR_START_INDEX : TS.PCR_START_INDEX + 4])[0]
-        b2 = struct.unpack(
-            ">H", packet[TS.PCR_START_INDEX + 4 : TS.PCR_START_INDEX + 6]
-        )[0]
-        base = (b1 << 1) | (b2 >> 15)  # 33 bit base
-        extension = b2 & 0x1FF  # 9 bit extension
+        return TS.get_pcr_base(packet)
+
+    @staticmethod
+    def get_pcr_base(packet):
+        """Get the Program Clock Reference for a packet already known to carry one.
+        Use get_pcr() if the adaptation field and PCR flag haven't been checked.
+        """
+        # 33 bit base is the top of the 6 PCR bytes, followed by 6 reserved
+        # bits and a 9 bit extension
+        base = (
+            int.from_bytes(packet[TS.PCR_START_INDEX : TS.PCR_START_INDEX + 5], "big")
+            >> 7
+        )
+        # extension = int.from_bytes(packet[10:12], "big") & 0x1FF
         # TODO: proper extension handling as per the spec
         # returning the base gives us good results currently
         # return base * 300 + extension
@@ -263,10 +325,23 @@ class TS(object):
         self._read_size = 0
         self.Progress = None
         self.OnTSPacket = None
+        self.OnPCR = None
         self.OnESPacket = None
         self.OnTSPacketError = None
         self.OnESPacketError = None
         self._elementary_streams = {}
+        self._target_es_pid = -1
+
+    def set_target_es_pid(self, pid):
+        """Assemble ES packets (and invoke OnESPacket) only for the given PID.
+        A negative PID restores assembly for every PID in the stream.
+        """
+        self._target_es_pid = pid
+        if pid >= 0:
+            # partial PES packets on other PIDs will never be completed now.
+            # (pruned in place, as Parse holds on to this dict)
+            for k in [k for k in self._elementary_streams if k != pid]:
+                del self._elementary_streams[k]
 
     def Parse(self):
         """Go through the .ts file, and invoke a callback on each TS packet and ES packet
@@ -274,68 +349,105 @@ class TS(object):
         """
         read_bytes = 0
         last_update = 0
+        # this loop runs for every packet in the file, so look up the static
+        # helpers and the PES dict once here rather than on each pass
+        get_payload_start = TS.get_payload_start
+        get_pid = TS.get_pid
+        get_pcr_base = TS.get_pcr_base
+        get_payload = TS.get_payload
+        pes_packet_check_formedness = ES.pes_packet_check_formedness
+        pes_packet_complete = ES.pes_packet_complete
+        get_pes_header_length = ES.get_pes_header_length
+        elementary_streams = self._elementary_streams
         for packet in TS.next_packet(self._filename):
             # check_packet_formedness(packet)
             # pei = TS.get_transport_error_indicator(packet)  # TODO unused
-            pusi = TS.get_payload_start(packet)
-            pid = TS.get_pid(packet)
+            pusi = get_payload_start(packet)
+            pid = get_pid(packet)
             # tsc = TS.get_tsc(packet)  # TODO unused
 
             # per .ts packet handler
             if self.OnTSPacket:
                 self.OnTSPacket(packet)
 
+            # per PCR handler. Only a small fraction of packets carry a PCR, so
+            # screen for the adaptation field and PCR flag bits here rather
+            # than call back into Python for every packet just to get timing.
+            if (
+                self.OnPCR
+                and packet[TS.ADAPTATION_FIELD_CONTROL_INDEX]
+                & TS.ADAPTATION_FIELD_PRESENT_MASK
+                and packet[TS.ADAPTATION_FIELD_DATA_INDEX] & TS.PCR_FLAG_MASK
+            ):
+                self.OnPCR(get_pcr_base(packet))
+
             read_bytes += TS.PACKET_SIZE
             new_bytes = read_bytes - last_update
             if new_bytes > 1000000:
                 last_update = read_bytes
-                self.Progress(new_bytes, self._total_filesize)
+                if self.Progress:
+                    self.Progress(new_bytes, self._total_filesize)
+
+            if self._target_es_pid >= 0 and pid != self._target_es_pid:
+                continue
 
             # adaptation_field_control = TS.get_adaptation_field_control(packet)  # TODO unused
             # continuity_counter = TS.get_continuity_counter(packet)  # TODO unused
 
             # put together PES from payloads
-            payload = TS.get_payload(packet)
+            payload = get_payload(packet)
             if pusi:
-                if not ES.pes_packet_check_formedness(payload):
-                    if pid in self._elementary_streams:
-                        self._elementary_streams[pid] = None
+                if not pes_packet_check_formedness(payload):
+                    if pid in elementary_streams:
+                        elementary_streams[pid] = None
                     continue
                 pes_id = ES.get_pes_stream_id(payload)
-                self._elementary_streams[pid] = payload
-            else:
-                if pid in self._elementary_streams:
-                    # TODO: check packet sequence counter
-                    if not self._elementary_streams[pid]:
-                        self._elementary_streams[pid] = ""
-                    self._elementary_streams[pid] += payload
+                # each PID keeps one growable PES buffer, refilled in place for
+                # every new PES rather than rebuilt by bytes concatenation.
+                es = elementary_streams.get(pid)
+                if es is None:
+                    es = elementary_streams[pid] = bytearray(payload)
                 else:
-                    # TODO: throw. this situaiton means out of order packets
-                    pass
-            if pid in self._elementary_streams and ES.pes_packet_complete(
-                self._elementary_streams[pid]
-            ):
+                    es[:] = payload
+            elif pid in elementary_streams:
+                # TODO: check packet sequence counter
+                es = elementary_streams[pid]
+                if es is None:
+                    es = elementary_streams[pid] = bytearray()
+                es += payload
+            else:
+                # TODO: throw. this situaiton means out of order packets
+                continue
+            if pes_packet_complete(es):
                 # TODO: handle packet contents here (callback)
-                es = self._elementary_streams[pid]
+                # note this buffer is reused for the next PES on this PID, so
+                # callbacks must copy anything they want to keep.
                 if self.OnESPacket:
-                    header_size = ES.get_pes_header_length(es)
+                    header_size = get_pes_header_length(es)
                     self.OnESPacket(pid, es, header_size)
 
+        # report whatever was read since the last progress update
+        if self.Progress and read_bytes > last_update:
+            self.Progress(read_bytes - last_update, self._total_filesize)
+
 
 # GLOBALS TO KEEP TRACK OF STATE
 initial_timestamp = 0
 elapsed_time_s = 0
+total_bytes_read = 0
 
 
-def OnProgress(bytes_read, total_bytes, percent):
+def OnProgress(bytes_read, total_bytes):
     """
     Callback method invoked on a change in file progress percent (not every packet)
     Meant as a lower frequency callback to update onscreen progress percent or something.
-    :param bytes_read:
-    :param total_bytes:
-    :param percent:
+    :param bytes_read: Bytes read since the last progress callback
+    :param total_bytes: Size of the file being parsed
     :return:
     """
+    global total_bytes_read
+    total_bytes_read += bytes_read
+    percent = 100.0 * total_bytes_read / total_bytes
     sys.stdout.write("progress: %.2f%%   \r" % (percent))
     sys.stdout.flush()
 
@@ -371,6 +483,8 @@ def OnESPacket(current_pid, packet, header_size):
 
 
 def main():
+    import argparse
+
     parser = argparse.ArgumentParser(
         description="Draw CC Packets from MPG2 Transport Stream file."
     )
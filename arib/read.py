@@ -11,6 +11,11 @@ import struct
 
 DEBUG = False
 
+# precompiled big endian formats used below
+_USB = struct.Struct(">H")
+_UIB = struct.Struct(">L")
+_ULB = struct.Struct(">Q")
+
 
 class EOFError(Exception):
     """Custom exception raised when we read to EOF"""
@@ -21,12 +26,11 @@ class EOFError(Exception):
 def split_buffer(length, buf):
     """split provided array at index x"""
     # print "split-buffer******"
-    a = []
     if len(buf) < length:
-        return (a, buf)
+        return ([], buf)
     # print "length of buf is" + str(len(buf))
-    for i in range(length):
-        a.append(buf.pop(0))
+    a = buf[:length]
+    del buf[:length]
     return (a, buf)
 
 
@@ -36,75 +40,78 @@ def dump_list(list):
 
 def ucb(f):
     """Read unsigned char byte from binary file"""
+    # this is called for every byte of caption data, so keep it lean:
+    # indexing bytes or popping from the list already gives us an int.
     if isinstance(f, list):
-        if len(f) < 1:
+        if not f:
             raise EOFError()
-        b, f = split_buffer(1, f)
-        return struct.unpack("B", bytes(b))[0]
+        return f.pop(0)
     else:
         _f = f.read(1)
-        if len(_f) < 1:
+        if not _f:
             raise EOFError()
-        return struct.unpack("B", _f)[0]
+        return _f[0]
 
 
 def usb(f):
     """Read unsigned short from binary file"""
     if isinstance(f, list):
         n, f = split_buffer(2, f)
-        return struct.unpack(">H", bytes(n))[0]
+        return _USB.unpack(bytes(n))[0]
     else:
         _f = f.read(2)
         if DEBUG:
             print(("usb: " + hex(_f[0]) + ":" + hex(_f[1])))
         if len(_f) < 2:
             raise EOFError()
-        return struct.unpack(">H", _f)[0]
+        return _USB.unpack(_f)[0]
 
 
 def ui3b(f):
     """Read 3 byte unsigned short from binary file"""
     if isinstance(f, list):
         n, f = split_buffer(3, f)
-        return struct.unpack(">I", b"\x00" + bytes(n))[0]
+        return _UIB.unpack(b"\x00" + bytes(n))[0]
     else:
         _f = f.read(3)
         if len(_f) < 3:
             raise EOFError()
 
-        return struct.unpack(">I", "\x00" + (_f))[0]
+        return _UIB.unpack(b"\x00" + (_f))[0]
 
 
 def uib(f):
     """"""
     if isinstance(f, list):
         n, f = split_buffer(4, f)
-        return struct.unpack(">L", bytes(n))[0]
+        return _UIB.unpack(bytes(n))[0]
     else:
         _f = f.read(4)
         if len(_f) < 4:
             raise EOFError()
 
-        return struct.unpack(">L", _f)[0]
+        return _UIB.unpack(_f)[0]
 
 
 def ulb(f):
     """Read unsigned long long (64bit integer) from binary file"""
     if isinstance(f, list):
         n, f = split_buffer(8, f)
-        return struct.unpack(">Q", bytes(n))[0]
+        return _ULB.unpack(bytes(n))[0]
     else:
         _f = f.read(8)
         if len(_f) < 8:
             raise EOFError()
-        return struct.unpack(">Q", _f)[0]
+        return _ULB.unpack(_f)[0]
 
 
 def buffer(f, size):
     """Read N bytes from either a file or list"""
     if isinstance(f, list):
+        if len(f) < size:
+            raise EOFError()
         n, f = split_buffer(size, f)
-        return "".join(n)
+        return bytes(n)
     else:
         _f = f.read(size)
         if len(_f) < size:
@@ -9,11 +9,10 @@ DATE: Saturday, May 24th 2014
 UPDATED: Saturday, Jan 12th 2017
 """
 
+import io
 import os
-import errno
 import sys
-import argparse
-import traceback
+import time
 
 from .read import EOFError
 
@@ -23,117 +22,141 @@ from .data_group import DataGroup
 from .arib_exceptions import FileOpenError
 
 from .mpeg.ts import TS
-from .mpeg.ts import ES
 
 from .ass import ASSFormatter
-from .ass import ASSFile
 
-import sys
-
-from tqdm import tqdm
-
-
-# GLOBALS TO KEEP TRACK OF STATE
-initial_timestamp = None
-elapsed_time_s = 0
-pid = -1
-VERBOSE = False
-SILENT = False
-DEBUG = False
-ass = None
-infilename = ""
-outfilename = ""
-tmax = 0
-pbar = None
 
-
-def OnProgress(bytes_read, total_bytes):
-    """
-    Callback method invoked on a change in file progress percent (not every packet)
-    Meant as a lower frequency callback to update onscreen progress percent or something.
-    :param bytes_read:
-    :param total_bytes:
-    :param percent:
-    :return:
+def process_caption(caption, elapsed_time_s, ass):
     """
-    global VERBOSE
-    global SILENT
-    global pbar
-    if not pbar:
-        pbar = tqdm(
-            total=total_bytes,
-            unit="B",
-            unit_scale=True,
-            unit_divisor=1024,
-            miniters=1,
-        )
-    if VERBOSE and not SILENT:
-        pbar.update(bytes_read)
-
-
-def OnTSPacket(packet):
-    """
-    Callback invoked on the successful extraction of a single TS packet from a ts file
-    :param packet: The entire packet (header and payload) as a string
+    Format the statement bodies in a caption statement data group payload.
+    :param caption: CaptionStatementData taken from a data group
+    :param elapsed_time_s: Time in seconds to stamp the captions with
+    :param ass: ASSFormatter to hand the decoded statements to
     :return: None
     """
-    global initial_timestamp
-    global elapsed_time_s
-    global time_offset
-
-    # pcr (program count record) can be used to calculate elapsed time in seconds
-    # we've read through the .ts file
-    pcr = TS.get_pcr(packet)
-    if pcr > 0:
-        current_timestamp = pcr
-        initial_timestamp = initial_timestamp or current_timestamp
-        delta = current_timestamp - initial_timestamp
-        elapsed_time_s = float(delta) / 90000.0 + time_offset
+    format_statement = ass.format
+    # iterate through the Data Units in this payload via another generator.
+    for data_unit in next_data_unit(caption):
+        # we're only interested in those Data Units which are "statement body" to get CC data.
+        # (nothing derives from StatementBody, so an exact type check will do)
+        statement = data_unit.payload()
+        if type(statement) is StatementBody:
+            format_statement(statement.payload(), elapsed_time_s)
+
+
+class DemuxCtx(object):
+    """State shared by the TS parser callbacks over one run of the tool.
+    The callbacks are bound methods of this object so the state they touch
+    on every packet is a plain attribute rather than a module global.
+    """
 
+    __slots__ = (
+        "initial_timestamp",
+        "elapsed_time_s",
+        "pid",
+        "ass",
+        "time_offset",
+        "verbose",
+        "silent",
+        "pbar",
+        "ts",
+        "error_report_times",
+        "suppressed_errors",
+    )
 
-def OnESPacket(current_pid, packet, header_size):
-    """
-    Callback invoked on the successful extraction of an Elementary Stream packet from the
-    Transport Stream file packets.
-    :param current_pid: The TS Program ID for the TS packets this info originated from
-    :param packet: The ENTIRE ES packet, header and payload-- which may have been assembled
-      from multiple TS packet payloads.
-    :param header_size: Size of the header in bytes (characters in the string). Provided to more
-      easily separate the packet into header and payload.
-    :return: None
-    """
-    global pid
-    global VERBOSE
-    global SILENT
-    global elapsed_time_s
-    global ass
-    global infilename
-    global outfilename
-    global tmax
-    global time_offset
-
-    if pid >= 0 and current_pid != pid:
-        return
-
-    try:
-        payload = ES.get_pes_payload(packet)
-        f = list(payload)
-        data_group = DataGroup(f)
-        if not data_group.is_management_data():
-            # We now have a Data Group that contains caption data.
-            # We take out its payload, but this is further divided into 'Data Unit' structures
-            caption = data_group.payload()
-            # iterate through the Data Units in this payload via another generator.
-            for data_unit in next_data_unit(caption):
-                # we're only interested in those Data Units which are "statement body" to get CC data.
-                if not isinstance(data_unit.payload(), StatementBody):
-                    continue
-
-                if not ass:
-                    v = not SILENT
-                    ass = ASSFormatter(tmax=tmax, video_filename=outfilename, verbose=v)
-
-                ass.format(data_unit.payload().payload(), elapsed_time_s)
+    # print a traceback for a given exception class at most this often (seconds)
+    ERROR_REPORT_INTERVAL = 60.0
+
+    def __init__(
+        self,
+        pid=-1,
+        ass=None,
+        time_offset=0.0,
+        verbose=False,
+        silent=False,
+    ):
+        self.initial_timestamp = None
+        self.elapsed_time_s = 0
+        self.pid = pid
+        self.ass = ass
+        self.time_offset = time_offset
+        self.verbose = verbose
+        self.silent = silent
+        self.pbar = None
+        self.ts = None
+        self.error_report_times = {}
+        self.suppressed_errors = 0
+
+    def on_progress(self, bytes_read, total_bytes):
+        """
+        Callback method invoked on a change in file progress percent (not every packet)
+        Meant as a lower frequency callback to update onscreen progress percent or something.
+        :param bytes_read:
+        :param total_bytes:
+        :return:
+        """
+        if not self.verbose or self.silent:
+            return
+        if not self.pbar:
+            # imported here so runs without a progress bar never load tqdm
+            from tqdm import tqdm
+
+            self.pbar = tqdm(
+                total=total_bytes,
+                unit="B",
+                unit_scale=True,
+                unit_divisor=1024,
+                mininterval=0.1,
+            )
+        self.pbar.update(bytes_read)
+
+    def on_pcr(self, pcr):
+        """
+        Callback invoked for each TS packet in the file that carries a PCR
+        :param pcr: The Program Clock Reference base of the packet (90kHz ticks)
+        :return: None
+        """
+        # pcr (program count record) can be used to calculate elapsed time in seconds
+        # we've read through the .ts file
+        self.initial_timestamp = self.initial_timestamp or pcr
+        delta = pcr - self.initial_timestamp
+        self.elapsed_time_s = float(delta) / 90000.0 + self.time_offset
+
+    def on_management_data_found(self, current_pid):
+        """
+        Lock onto the PID carrying caption management data, so the TS parser
+        stops assembling ES packets for every other PID in the stream.
+        :param current_pid: The TS Program ID the management data arrived on
+        :return: None
+        """
+        self.pid = current_pid
+        if self.ts:
+            self.ts.set_target_es_pid(current_pid)
+
+    def on_es_packet(self, current_pid, packet, header_size):
+        """
+        Callback invoked on the successful extraction of an Elementary Stream packet from the
+        Transport Stream file packets.
+        :param current_pid: The TS Program ID for the TS packets this info originated from
+        :param packet: The ENTIRE ES packet, header and payload-- which may have been assembled
+          from multiple TS packet payloads.
+        :param header_size: Size of the header in bytes (characters in the string). Provided to more
+          easily separate the packet into header and payload.
+        :return: None
+        """
+        if self.pid >= 0 and current_pid != self.pid:
+            return
+
+        try:
+            # parse the data group straight out of the PES packet, past its header
+            f = io.BytesIO(packet)
+            f.seek(header_size)
+            data_group = DataGroup(f)
+            if not data_group.is_management_data():
+                # We now have a Data Group that contains caption data.
+                # We take out its payload, but this is further divided into 'Data Unit' structures
+                caption = data_group.payload()
+                process_caption(caption, self.elapsed_time_s, self.ass)
 
                 # this code used to sed the PID we're scanning via first successful ARIB decode
                 # but i've changed it below to draw present CC language info form ARIB
@@ -143,48 +166,56 @@ def OnESPacket(current_pid, packet, header_size):
                 #  print("Found Closed Caption data in PID: " + str(pid))
                 #  print("Will now only process this PID to improve performance.")
 
-        else:
-            # management data
-            management_data = data_group.payload()
-            numlang = management_data.num_languages()
-            if pid < 0 and numlang > 0:
-                for language in range(numlang):
-                    if not SILENT:
-                        print(
-                            (
-                                "Closed caption management data for language: "
-                                + management_data.language_code(language)
-                                + " available in PID: "
-                                + str(current_pid)
+            else:
+                # management data
+                management_data = data_group.payload()
+                numlang = management_data.num_languages()
+                if self.pid < 0 and numlang > 0:
+                    for language in range(numlang):
+                        if not self.silent:
+                            print(
+                                (
+                                    "Closed caption management data for language: "
+                                    + management_data.language_code(language)
+                                    + " available in PID: "
+                                    + str(current_pid)
+                                )
+                            )
+                            print(
+                                "Will now only process this PID to improve performance."
                             )
-                        )
-                        print("Will now only process this PID to improve performance.")
-                pid = current_pid
-
-    except EOFError:
-        pass
-    except FileOpenError as ex:
-        # allow IOErrors to kill application
-        raise ex
-    except Exception as err:
-        if not SILENT and pid >= 0:
-            print(
-                (
-                    "Exception thrown while handling DataGroup in ES. This may be due to many factors"
-                    + "such as file corruption or the .ts file using as yet unsupported features."
+                    self.on_management_data_found(current_pid)
+
+        except EOFError:
+            pass
+        except FileOpenError as ex:
+            # allow IOErrors to kill application
+            raise ex
+        except Exception:
+            if not self.silent and self.pid >= 0:
+                # a corrupt stream can fail on every packet, so don't dump the same
+                # kind of traceback over and over, just count them.
+                now = time.monotonic()
+                error_class = sys.exc_info()[0]
+                last = self.error_report_times.get(error_class)
+                if last is not None and now - last < DemuxCtx.ERROR_REPORT_INTERVAL:
+                    self.suppressed_errors += 1
+                    return
+                self.error_report_times[error_class] = now
+                print(
+                    (
+                        "Exception thrown while handling DataGroup in ES. This may be due to many factors"
+                        + "such as file corruption or the .ts file using as yet unsupported features."
+                    )
                 )
-            )
-            traceback.print_exc(file=sys.stdout)
+                # only needed once something has gone wrong, so import it here
+                import traceback
+
+                traceback.print_exc(file=sys.stdout)
 
 
 def main():
-    global pid
-    global VERBOSE
-    global SILENT
-    global infilename
-    global outfilename
-    global tmax
-    global time_offset
+    import argparse
 
     parser = argparse.ArgumentParser(
         description="Remove ARIB formatted Closed Caption information from an MPEG TS file and format the results as a standard .ass subtitle file."
@@ -241,13 +272,33 @@ def main():
         print("Input filename :" + infilename + " does not exist.")
         sys.exit(-1)
 
+    ctx = DemuxCtx(
+        pid=pid,
+        ass=ASSFormatter(tmax=tmax, video_filename=outfilename, verbose=not SILENT),
+        time_offset=time_offset,
+        verbose=VERBOSE,
+        silent=SILENT,
+    )
+
     ts = TS(infilename)
+    ctx.ts = ts
+    if pid >= 0:
+        ts.set_target_es_pid(pid)
 
-    ts.Progress = OnProgress
-    ts.OnTSPacket = OnTSPacket
-    ts.OnESPacket = OnESPacket
+    # only verbose runs draw a progress bar, so don't have the parser call back otherwise
+    if VERBOSE and not SILENT:
+        ts.Progress = ctx.on_progress
+    ts.OnPCR = ctx.on_pcr
+    ts.OnESPacket = ctx.on_es_packet
 
     ts.Parse()
+    if ctx.pbar:
+        ctx.pbar.close()
+
+    pid = ctx.pid
+    ass = ctx.ass
+    if ctx.suppressed_errors and not SILENT:
+        print("%d further DataGroup exception(s) not shown." % ctx.suppressed_errors)
 
     if pid < 0 and not SILENT:
         print(
@@ -7,6 +7,7 @@ Email: oneil.john@gmail.com
 DATE: Thursday, October 20th 2016
 
 """
+import io
 import os
 import sys
 import argparse
@@ -75,6 +76,7 @@ pid = -1
 VERBOSE = True
 SILENT = False
 DEBUG = False
+total_bytes_read = 0
 
 
 def formatter(statements, timestamp):
@@ -87,18 +89,20 @@ def formatter(statements, timestamp):
     return line
 
 
-def OnProgress(bytes_read, total_bytes, percent):
+def OnProgress(bytes_read, total_bytes):
     """
     Callback method invoked on a change in file progress percent (not every packet)
     Meant as a lower frequency callback to update onscreen progress percent or something.
-    :param bytes_read:
-    :param total_bytes:
-    :param percent:
+    :param bytes_read: Bytes read since the last progress callback
+    :param total_bytes: Size of the file being parsed
     :return:
     """
     global VERBOSE
     global SILENT
+    global total_bytes_read
+    total_bytes_read += bytes_read
     if not VERBOSE and not SILENT:
+        # percent = 100.0 * total_bytes_read / total_bytes
         # sys.stdout.write("progress: %.2f%%   \r" % (percent))
         # sys.stdout.flush()
         pass
@@ -142,8 +146,9 @@ def OnESPacket(current_pid, packet, header_size):
         return
 
     try:
-        payload = ES.get_pes_payload(packet)
-        f = list(payload)
+        # parse the data group straight out of the PES packet, past its header
+        f = io.BytesIO(packet)
+        f.seek(header_size)
         data_group = DataGroup(f)
         if not data_group.is_management_data():
             # We now have a Data Group that contains caption data.